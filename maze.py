@@ -1,8 +1,11 @@
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
-from typing import Dict, Type, TypeVar, Tuple, List, Optional
+from functools import lru_cache
+from typing import Callable, Dict, Type, TypeVar, Tuple, List
 
 import numpy as np
+from numba import njit  # type: ignore
 from numpy import ndarray
 
 M = TypeVar('M', bound='Maze')
@@ -45,6 +48,11 @@ class Movement(Enum):
 class Maze(object):
     # List of all possible movements (North, East, South, West)
     MOVEMENTS: List[Movement] = Movement.get_all()
+    # Chars of the movements indexed by their integer direction code
+    MOVEMENT_CHARS: str = ''.join(movement.value for movement in MOVEMENTS)
+    # Lookup table from the direction codes to the bytes of the chars
+    _MOVEMENT_TABLE: ndarray = np.frombuffer(MOVEMENT_CHARS.encode(),
+                                             dtype=np.uint8)
 
     # Some constants for the replacement with the chars in the maze file
     START_POINT: int = 2
@@ -67,31 +75,57 @@ class Maze(object):
         "S": SOUTH,
         "W": WEST
     }
-
-    # Container for the two-dimensional list
-    maze: ndarray
+    # Lookup table from the bytes of a maze file to the integers, -1 for
+    # unknown chars
+    _CHAR_TABLE: ndarray = np.full(256, -1, dtype=np.int8)
+    _CHAR_TABLE[[ord(char) for char in CHAR_MAP]] = list(CHAR_MAP.values())
+    # Lookup table from the integers back to the bytes of the chars
+    _INVERSE_CHAR_TABLE: ndarray = np.zeros(256, dtype=np.uint8)
+    _INVERSE_CHAR_TABLE[list(CHAR_MAP.values())] = \
+        [ord(char) for char in CHAR_MAP]
+    # Cell values of the movements indexed by their direction code
+    _MOVEMENT_VALUES: ndarray = np.array(
+        list(map(CHAR_MAP.get, MOVEMENT_CHARS)), dtype=np.int8)
 
     # Points in the maze representing current position and position of
     # goal
-    current_pos: Tuple[int, int] = (0, 0)
-    goal_pos: Tuple[int, int] = (0, 0)
+    current_pos: Tuple[int, int]
+    goal_pos: Tuple[int, int]
 
-    # Store of the path which has been followed
-    path: List[Tuple[int, int]] = []
-    # Store of all the movements which have been made
-    # Those movements are in relation to the points in the path List
-    movements: List[Movement] = []
+    # Store of the path which has been followed as (x, y) rows
+    path: ndarray
+    # Store of all the movements which have been made as direction codes
+    # (index in MOVEMENTS)
+    # Those movements are in relation to the points in the path array
+    movements: ndarray
 
     def __init__(self, maze: ndarray) -> None:
-        self.maze = maze
+        # Container for the two-dimensional list with a WALL border, so
+        # the compiled searches need no bounds checks. Points in it are
+        # shifted by one.
+        self._grid = np.pad(maze, 1, constant_values=self.WALL)
+        # Offsets of the neighbours in the flattened grid (in the order of
+        # MOVEMENTS)
+        width = self._grid.shape[1]
+        self._steps = np.array([-width, 1, width, -1])
+        self.current_pos = (0, 0)
+        self.goal_pos = (0, 0)
+        self.path = np.empty((0, 2), dtype=np.int32)
+        self.movements = np.empty(0, dtype=np.uint8)
+
+    @property
+    def maze(self) -> ndarray:
+        # View of the grid without the border, so all searches work on
+        # the same cells
+        return self._grid[1:-1, 1:-1]
 
     def get_start_point(self) -> Tuple[int, int]:
-        return self.__get_point(self.START_POINT)
+        return self.__get_start_and_goal_point()[0]
 
     def get_goal_point(self) -> Tuple[int, int]:
-        return self.__get_point(self.GOAL_POINT)
+        return self.__get_start_and_goal_point()[1]
 
-    def solve(self) -> bool:
+    def solve(self, specialize: bool = False) -> bool:
         """
         The algorithm searches depth first for a possible path.
         1. Get the start point.
@@ -106,63 +140,170 @@ class Maze(object):
 
         Stop of the algorithm in one of those cases:
         1) Path reaches the goal point.
-        2) Had as many exceptional cases in step 2 that it got back to
-           the start point.
+        2) Had as many exceptional cases in step 2 that it stepped back
+           from the start point.
+
+        :param specialize: use a search compiled for the shape of this
+                           maze, which is faster when solving many mazes
+                           of the same size but takes a compile for each
+                           new shape
+        :return: bool TRUE if there is a result, FALSE if there is no
+                      path found from A to B
+        """
+        self.current_pos, self.goal_pos = \
+            self.__get_start_and_goal_point()
+
+        start = self.__get_flat_point(self.current_pos)
+        goal = self.__get_flat_point(self.goal_pos)
+        if specialize:
+            solve = _make_solve(*self._grid.shape)
+            solved, path, self.movements = solve(
+                self._grid.ravel(), start, goal)
+        else:
+            solved, path, self.movements = _solve(
+                self._grid.ravel(), self._steps, start, goal)
+        self.path = path - 1
+        if solved:
+            self.current_pos = self.goal_pos
+        return solved
+
+    def solve_bidirectional(self) -> bool:
+        """
+        Search depth first from the start and from the goal point at the
+        same time, each half in its own thread. Both halves keep every
+        visited point marked and stop as soon as one of them reaches a
+        point visited by the other one. The path is then joined from
+        both halves, so it is not necessarily the one found by solve().
 
         :return: bool TRUE if there is a result, FALSE if there is no
                       path found from A to B
         """
-        self.current_pos = self.get_start_point()
-        self.goal_pos = self.get_goal_point()
-
-        # loop as long as we don't reach goal position
-        while True:
-            # Step 1: get the next possible movement
-            next_movement = self.__get_next_possible_movement()
-            while next_movement is None:
-                # Step 2: Exceptional case: no possible movement anymore
-                # Step back and repeat Step 2
-                self.path.pop()
-                if len(self.path) == 0:
-                    # Stop case 2: no solution found as we are at the
-                    # beginning again
-                    return False
-
-                # Step 1: get next possible movement after step back
-                # in exceptional case.
-                self.current_pos = self.path[-1]
-                last_movement = self.movements.pop()
-                next_movement = self.__get_next_possible_movement(
-                    last_movement)
-
-            # Step 3: Follow possible movement
-            self.current_pos = \
-                self.__get_point_by_movement(
-                    self.current_pos, next_movement
-                )
-
-            # Stop case 1: Goal reached
-            if self.current_pos == self.goal_pos:
+        self.current_pos, self.goal_pos = \
+            self.__get_start_and_goal_point()
+
+        grid = self._grid.ravel()
+        start = self.__get_flat_point(self.current_pos)
+        goal = self.__get_flat_point(self.goal_pos)
+        # The start points are marked before the threads are started, so
+        # a half which runs out of movements has seen the whole reachable
+        # area without reaching the other half
+        visited_start = np.zeros(grid.size, dtype=np.uint8)
+        visited_goal = np.zeros(grid.size, dtype=np.uint8)
+        visited_start[start] = 1
+        visited_goal[goal] = 1
+        parents_start = np.zeros(grid.size, dtype=np.uint8)
+        parents_goal = np.zeros(grid.size, dtype=np.uint8)
+        done = np.zeros(1, dtype=np.uint8)
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            from_start = executor.submit(
+                _search_half, grid, self._steps, start, _PASSABLE_TO_GOAL,
+                visited_start, visited_goal, parents_start, done)
+            from_goal = executor.submit(
+                _search_half, grid, self._steps, goal, _PASSABLE_TO_START,
+                visited_goal, visited_start, parents_goal, done)
+            meeting_points = [from_start.result(), from_goal.result()]
+
+        for meeting in meeting_points:
+            if meeting >= 0:
+                path, self.movements = _join_halves(
+                    parents_start, parents_goal, self._steps, start, goal,
+                    meeting)
+                self.path = path - 1
+                self.current_pos = self.goal_pos
                 return True
 
-            self.movements.append(next_movement)
-            self.path.append(self.current_pos)
+        self.path = np.empty((0, 2), dtype=np.int32)
+        self.movements = np.empty(0, dtype=np.uint8)
+        return False
+
+    def solve_bfs(self) -> bool:
+        """
+        The algorithm searches breadth first for a shortest path.
+        1. Flood all points reachable with one more movement from the
+           points reached in the last step at once, by shifting the
+           whole area of those points in the four directions.
+        2. Store the number of the step for all newly reached points and
+           repeat step 1 until the goal point is reached.
+        3. Follow the path back from the goal point along decreasing
+           step numbers.
+
+        :return: bool TRUE if there is a result, FALSE if there is no
+                      path found from A to B
+        """
+        self.current_pos, self.goal_pos = \
+            self.__get_start_and_goal_point()
+
+        sx, sy = self.current_pos
+        gx, gy = self.goal_pos
+        height, width = self.maze.shape
+        # Only EMPTY and GOAL_POINT is a possible movement
+        passable = _PASSABLE_TO_GOAL[self.maze]
+        distance = np.full(self.maze.shape, -1, dtype=np.int32)
+        distance[sy, sx] = 0
+        frontier = np.zeros(self.maze.shape, dtype=bool)
+        frontier[sy, sx] = True
+        reached = frontier.copy()
+
+        step = 0
+        while not reached[gy, gx]:
+            # Step 1: flood the neighbours of the last reached points
+            flooded = np.zeros_like(frontier)
+            flooded[1:, :] |= frontier[:-1, :]
+            flooded[:-1, :] |= frontier[1:, :]
+            flooded[:, 1:] |= frontier[:, :-1]
+            flooded[:, :-1] |= frontier[:, 1:]
+            frontier = flooded & passable & ~reached
+            if not frontier.any():
+                # no solution found as no new point can be reached
+                self.path = np.empty((0, 2), dtype=np.int32)
+                self.movements = np.empty(0, dtype=np.uint8)
+                return False
+
+            # Step 2: store the step number of the new points
+            step += 1
+            reached |= frontier
+            distance[frontier] = step
+
+        # Step 3: follow the path back to the start point, with the
+        # offsets as plain ints in a local for the Python loop
+        offsets = list(enumerate(_OFFSETS.tolist()))
+        moves = np.empty(step, dtype=np.uint8)
+        x, y = gx, gy
+        for i in range(step - 1, -1, -1):
+            for d, (dx, dy) in offsets:
+                px, py = x - dx, y - dy
+                if 0 <= py < height and 0 <= px < width \
+                        and distance[py, px] == i:
+                    break
+            moves[i] = d
+            x, y = px, py
+
+        # As in solve() the movement into the goal point is not stored
+        self.movements = moves[:-1]
+        self.path = (np.array(self.current_pos) + np.cumsum(
+            _OFFSETS[self.movements], axis=0)).astype(np.int32)
+        self.current_pos = self.goal_pos
+        return True
 
     @classmethod
     def from_txt(cls: Type[M], file: str) -> M:
         try:
-            f = open(file, "r")
+            f = open(file, "rb")
 
             lines = f.read().splitlines()
             f.close()
 
-            matrix = []
-            for line in lines:
-                for i, j in Maze.CHAR_MAP.items():
-                    line = line.replace(i, str(j))
-                elements = list(map(int, list(line)))
-                matrix.append(np.array(elements))
-            maze = np.array(matrix)
+            if len(set(map(len, lines))) > 1:
+                raise ValueError(
+                    "Lines of different width in file {}".format(file))
+
+            # translate all chars at once with the lookup table
+            data = np.frombuffer(b''.join(lines), dtype=np.uint8)
+            maze = cls._CHAR_TABLE[data].reshape(len(lines), -1)
+            if (maze < 0).any():
+                raise ValueError("Unknown char {!r} in file {}".format(
+                    chr(data[np.argmax(maze.ravel() < 0)]), file))
             return cls(maze)
         except FileNotFoundError:
             print("Could not open file {}".format(file),
@@ -171,14 +312,11 @@ class Maze(object):
 
     @staticmethod
     def get_maze(maze: ndarray) -> str:
-        output = ''
-        for line in maze:
-            line = list(map(str, list(line)))
-            str_line = ''.join(line)
-            for i, j in Maze.CHAR_MAP.items():
-                str_line = str_line.replace(str(j), i)
-            output += str_line + "\n"
-        return output
+        # translate all integers at once with the inverse lookup table
+        # and add a newline column to the end of each line
+        chars = Maze._INVERSE_CHAR_TABLE[maze]
+        lines = np.pad(chars, ((0, 0), (0, 1)), constant_values=ord("\n"))
+        return lines.tobytes().decode()
 
     def get_maze_with_movements(self) -> str:
         """
@@ -187,75 +325,252 @@ class Maze(object):
         :return: string
         """
         maze = self.maze.copy()
-        movements = self.movements.copy()
-        for point in self.path:
-            x, y = point
-            maze[y][x] = self.CHAR_MAP[movements.pop(0).value]
+        maze[self.path[:, 1], self.path[:, 0]] = \
+            self._MOVEMENT_VALUES[self.movements]
         return self.get_maze(maze)
 
     def get_path(self) -> str:
-        return ''.join([movement.value for movement in self.movements])
+        return self._MOVEMENT_TABLE[self.movements].tobytes().decode()
 
     def __str__(self) -> str:
         return self.get_maze(self.maze)
 
-    @staticmethod
-    def __get_point_by_movement(point: Tuple[int, int],
-                                movement: Movement) -> Tuple[int, int]:
-        # calculate the next point based on the direction to go
-        x, y = point
-        if movement == Movement.NORTH:
-            return x, y - 1
-        if movement == Movement.EAST:
-            return x + 1, y
-        if movement == Movement.SOUTH:
-            return x, y + 1
-        if movement == Movement.WEST:
-            return x - 1, y
-        raise Exception("Unknown movement {}".format(movement))
-
-    def __get_point(self, point: int) \
-            -> Tuple[int, int]:
-        # Search for start or goal point
-        result = np.where(self.maze == point)
-        y, x = int(result[0]), int(result[1])
-        return x, y
-
-    def __is_valid_point(self, point: Tuple[int, int]) -> bool:
+    def __get_flat_point(self, point: Tuple[int, int]) -> int:
+        # Index of a point in the flattened grid with the border
         x, y = point
-        if point in self.path:
-            # Cycle detected: no possible movement
-            return False
-        # Only EMPTY and GOAL_POINT is a possible movement
-        return self.maze[y, x] and self.maze[y, x] in \
-            [self.EMPTY, self.GOAL_POINT]
-
-    def __get_next_possible_movement(
-            self, already_tried_movement: Optional[Movement] = None
-    ) -> Optional[Movement]:
-        # find possible movement starting from the
-        # already_tried_movement (this is the case when stepping back)
-        movements = self.MOVEMENTS
-        if already_tried_movement:
-            # remove the already tried movements
-            index_last_movement = self.MOVEMENTS.index(
-                already_tried_movement)
-            movements = self.MOVEMENTS[index_last_movement + 1:]
-
-        for movement in movements:
-            # loop through all movements and check whether there is a
-            # valid path to follow
-            if len(self.movements) > 0:
-                # the path back is not allowed
-                if movement == self.movements[-1].get_opposite:
-                    continue
-
-            next_point = self.__get_point_by_movement(
-                self.current_pos, movement
-            )
-            if self.__is_valid_point(next_point):
-                return movement
-        return None
+        return (y + 1) * self._grid.shape[1] + x + 1
+
+    def __get_start_and_goal_point(self) \
+            -> Tuple[Tuple[int, int], Tuple[int, int]]:
+        # Search for start and goal point in a single sweep over the
+        # contiguous grid and remove the shift of its border
+        flat = self._grid.ravel()
+        indices = np.flatnonzero(
+            (flat == self.START_POINT) | (flat == self.GOAL_POINT))
+        width = self._grid.shape[1]
+        points = {int(flat[i]): (int(i % width) - 1, int(i // width) - 1)
+                  for i in indices}
+        return points[self.START_POINT], points[self.GOAL_POINT]
+
+
+# Lookup tables of the possible movements by cell value (EMPTY and the
+# point searched for) and (x, y) offsets of the directions (in the order
+# of Maze.MOVEMENTS) used by the searches, as numba cannot read class
+# attributes
+_PASSABLE_TO_GOAL = np.zeros(256, dtype=bool)
+_PASSABLE_TO_GOAL[[Maze.EMPTY, Maze.GOAL_POINT]] = True
+_PASSABLE_TO_START = np.zeros(256, dtype=bool)
+_PASSABLE_TO_START[[Maze.EMPTY, Maze.START_POINT]] = True
+_OFFSETS = np.array([(0, -1), (1, 0), (0, 1), (-1, 0)])
+# First direction in a bitmask of directions (bit d set for direction
+# d), 4 if no bit is set
+_FIRST_DIRECTION = np.array([4, 0, 1, 0, 2, 0, 1, 0,
+                             3, 0, 1, 0, 2, 0, 1, 0], dtype=np.uint8)
+
+
+@njit(cache=True, nogil=True, boundscheck=False, inline='always')
+def _open_directions(grid: ndarray, visited: ndarray, point: int,
+                     steps: ndarray, passable: ndarray) -> int:
+    """
+    Check all four neighbours of a point in the flattened grid, with
+    steps as the offsets of the neighbours, without branching on the
+    result of a single neighbour. The grid needs a WALL border (see
+    Maze.__init__), so no neighbour is outside of it.
+
+    :return: bitmask with bit d set if direction d leads to a not
+             visited passable point
+    """
+    mask = 0
+    for d in range(4):
+        n = point + steps[d]
+        is_open = (visited[n] == 0) & passable[grid[n]]
+        mask |= int(is_open) << d
+    return mask
+
+
+@njit(cache=True, boundscheck=False, inline='always')
+def _solve(grid: ndarray, steps: ndarray, start: int, goal: int) \
+        -> Tuple[bool, ndarray, ndarray]:
+    """
+    Compiled depth first search as described in Maze.solve on the
+    flattened grid, with points as flat indices and steps as the offsets
+    of the neighbours in it (in the order of Maze.MOVEMENTS). Directions
+    are encoded as integers 0 - 3 (north, east, south, west), so the
+    opposite direction is d ^ 2.
+
+    :return: tuple of the result, the points of the path as (x, y) rows
+             and the movements leading to those points
+    """
+    size = grid.size
+    width = steps[2]
+    # Stack of frames with the point, the movement which led to it and
+    # the next direction to try from it. The first frame is the start
+    # point, which has no movement (4 has no opposite in 0 - 3). A
+    # bitmap of the points on the stack is used for cycle detection.
+    points = np.empty(size, dtype=np.int32)
+    moves = np.empty(size, dtype=np.uint8)
+    cursors = np.empty(size, dtype=np.uint8)
+    visited = np.zeros(size, dtype=np.uint8)
+    top = 0
+    points[0] = start
+    moves[0] = 4
+    cursors[0] = 0
+    visited[start] = 1
+
+    while top >= 0:
+        point = points[top]
+
+        # Step 1: get the next possible movement starting at the cursor,
+        # the path back is not allowed
+        mask = _open_directions(grid, visited, point, steps,
+                                _PASSABLE_TO_GOAL)
+        mask &= (15 << cursors[top]) & ~(1 << (moves[top] ^ 2))
+        d = _FIRST_DIRECTION[mask]
+
+        if d == 4:
+            # Step 2: Exceptional case: no possible movement anymore
+            # Step back and resume at the cursor of the previous point
+            visited[point] = 0
+            top -= 1
+            continue
+        cursors[top] = d + 1
+        n = point + steps[d]
+
+        # Stop case 1: Goal reached
+        if n == goal:
+            path = np.empty((top, 2), dtype=np.int32)
+            for i in range(top):
+                path[i, 0] = points[i + 1] % width
+                path[i, 1] = points[i + 1] // width
+            return True, path, moves[1:top + 1]
+
+        # Step 3: Follow possible movement
+        top += 1
+        points[top] = n
+        moves[top] = d
+        cursors[top] = 0
+        visited[n] = 1
+
+    # Stop case 2: no solution found as all movements from the start
+    # point have been tried
+    return False, np.empty((0, 2), dtype=np.int32), moves[:0]
+
+
+@lru_cache(maxsize=8)
+def _make_solve(height: int, width: int) \
+        -> Callable[[ndarray, int, int], Tuple[bool, ndarray, ndarray]]:
+    """
+    Compile _solve for grids of one shape, for solving many mazes of the
+    same size. _solve is inlined and numba freezes the offsets of the
+    neighbours as constants, so they are folded into the kernel. The
+    kernels are only kept in memory for the last few shapes, as each
+    one takes a full compile.
+    """
+    # Offsets of the neighbours in the flattened grid (in the order of
+    # Maze.MOVEMENTS)
+    steps = np.array([-width, 1, width, -1])
+
+    @njit(boundscheck=False)
+    def solve(grid: ndarray, start: int, goal: int) \
+            -> Tuple[bool, ndarray, ndarray]:
+        return _solve(grid, steps, start, goal)
+
+    return solve
+
+
+@njit(cache=True, nogil=True, boundscheck=False)
+def _search_half(grid: ndarray, steps: ndarray, start: int,
+                 passable: ndarray, visited: ndarray, other: ndarray,
+                 parents: ndarray, done: ndarray) -> int:
+    """
+    One half of Maze.solve_bidirectional: depth first search on the
+    flattened grid from start over passable points. Other than in
+    Maze.solve, visited points stay marked after stepping back. The
+    movement which led to a point is stored in parents.
+
+    :return: the meeting point with the other half, or -1 if the search
+             was stopped or found no path
+    """
+    # Stack of frames with the point and the next direction to try
+    points = np.empty(grid.size, dtype=np.int32)
+    cursors = np.empty(grid.size, dtype=np.uint8)
+    top = 0
+    points[0] = start
+    cursors[0] = 0
+
+    while top >= 0:
+        if done[0]:
+            # the other half has finished
+            return -1
+        point = points[top]
+
+        mask = _open_directions(grid, visited, point, steps, passable)
+        d = _FIRST_DIRECTION[mask & (15 << cursors[top])]
+
+        if d == 4:
+            top -= 1
+            continue
+        cursors[top] = d + 1
+        n = point + steps[d]
+
+        parents[n] = d
+        visited[n] = 1
+        if other[n]:
+            done[0] = 1
+            return n
+
+        top += 1
+        points[top] = n
+        cursors[top] = 0
+
+    # No path: stop the other half as well
+    done[0] = 1
+    return -1
+
+
+@njit(cache=True, boundscheck=False)
+def _join_halves(parents_start: ndarray, parents_goal: ndarray,
+                 steps: ndarray, start: int, goal: int, meeting: int) \
+        -> Tuple[ndarray, ndarray]:
+    """
+    Join the movements of both halves of Maze.solve_bidirectional at
+    the meeting point in the flattened grid.
+
+    :return: tuple of the points of the path as (x, y) rows and the
+             movements leading to those points
+    """
+    width = steps[2]
+    moves = np.empty(parents_start.size, dtype=np.uint8)
+
+    # Walk back from the meeting point to the start point
+    length = 0
+    point = meeting
+    while point != start:
+        d = parents_start[point]
+        moves[length] = d
+        length += 1
+        point -= steps[d]
+    for i in range(length // 2):
+        moves[i], moves[length - 1 - i] = moves[length - 1 - i], moves[i]
+
+    # Walk on from the meeting point to the goal point, in the opposite
+    # direction of the movements of the second half
+    point = meeting
+    while point != goal:
+        d = parents_goal[point] ^ 2
+        moves[length] = d
+        length += 1
+        point += steps[d]
+
+    # As in Maze.solve the movement into the goal point is not stored
+    length -= 1
+    points = np.empty((length, 2), dtype=np.int32)
+    point = start
+    for i in range(length):
+        point += steps[moves[i]]
+        points[i, 0] = point % width
+        points[i, 1] = point // width
+    return points, moves[:length]
 
 
 def main(file: str) -> None: